@@ -6,19 +6,30 @@ Code to download data directly from online sources of record to feed into script
 
 # Import libraries
 import arcpy
+import asyncio
+import aiohttp
+import glob
+import gzip
+import hashlib
+import json
+import math
 import os
+import threading
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 
 arcpy.env.overwriteOutput = True
 
 # Define target spatial reference
 target_sr = arcpy.SpatialReference(26913)  # NAD 1983 UTM Zone 13N
+wgs84_sr = arcpy.SpatialReference(4326)  # WGS 1984, used for the REST query envelope
 
 arcpy.env.workspace = r'E:\CFRI\Colorado_Fire_Severity\Fire_Perimeters\UPDATE'
 fldr = arcpy.env.workspace
 scratch_workspace = os.path.join(fldr, 'scratch')
 scratch_gdb = os.path.join(fldr, 'dwnld_perimeters.gdb')
+cache_dir = os.path.join(fldr, 'cache')  # raw feature service downloads, reused until the service is edited
 
 CO_perim = r"E:\CFRI\BASE_LAYER_DATA\GENERAL_DATA_LAYERS\ADMINISTRATIVE_BOUNDARIES\US_States_Colorado.shp"
 
@@ -30,102 +41,254 @@ geomac_url = "https://services3.arcgis.com/T4QMspbfLg3qTGWY/ArcGIS/rest/services
 blm_veg_url = "https://gis.blm.gov/coarcgis/rest/services/vegetation/BLM_Colorado_Vegetation_Treatment_Area_Completed_Polygons/FeatureServer/23"
 #usfs_url = "htts://data.fs.usda.gov/govdata/edw/edw_resources/fc/S_USA_Actv_CommonAttribute_PL.gdb.zip ## NEEDS TESTING
 
+# REST query paging
+page_size = 2000  # records requested per page (capped by the service maxRecordCount)
+max_concurrent_requests = 8  # requests in flight at the same time, across all services
+geometry_precision = 3  # decimal places of the returned coordinates (mm, the default File GDB XY tolerance)
+max_download_workers = 6  # threads saving downloaded feature services
 
-def import_feature_service_filter(feature_service_url, output_fc, filtered_perimeter, CO_perim):
+write_lock = threading.Lock()
+
+
+async def fetch_json(session, semaphore, url, params, post=False):
+    """
+    Sends one request to the REST endpoint and returns the decoded JSON response.
+    Requests with long parameters (object ID lists) are sent as a POST form so the
+    URL stays within the server's length limit.
+    """
+    async with semaphore:
+        request = session.post(url, data=params) if post else session.get(url, params=params)
+        async with request as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+    # ArcGIS REST reports query errors in the response body rather than the HTTP status
+    if "error" in result:
+        raise RuntimeError(f"{url}: {result['error'].get('message')}")
+    return result
+
+
+def envelope_wgs84(fc):
+    """
+    Returns the extent of a feature class as an "xmin,ymin,xmax,ymax" string in WGS 1984.
+    """
+    extent = arcpy.Describe(fc).extent.projectAs(wgs84_sr)
+    return f"{extent.XMin},{extent.YMin},{extent.XMax},{extent.YMax}"
+
+
+def cache_path(feature_service_url, envelope, layer_info):
+    """
+    Returns the cache file of a download, keyed by the query and the service's last edit
+    date, or None when the service does not report when it was last edited.
+    """
+    last_edit = layer_info.get("editingInfo", {}).get("lastEditDate")
+    if last_edit is None:
+        return None
+    query = f"{feature_service_url}?{envelope}&{target_sr.factoryCode}&{geometry_precision}"
+    key = hashlib.sha256(query.encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}_{last_edit}.json.gz")
+
+
+def read_cache(cache_file):
+    """
+    Loads a feature set saved by write_cache.
+    """
+    with gzip.open(cache_file, "rt") as f:
+        return json.load(f)
+
+
+def write_cache(cache_file, feature_set):
+    """
+    Saves a downloaded feature set and removes older downloads of the same query.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = os.path.basename(cache_file).rsplit("_", 1)[0]
+    for stale_file in glob.glob(os.path.join(cache_dir, f"{key}_*.json.gz")):
+        os.remove(stale_file)
+    with gzip.open(cache_file, "wt") as f:
+        json.dump(feature_set, f)
+
+
+async def fetch_features(session, semaphore, executor, feature_service_url, envelope):
+    """
+    Gets the number of features intersecting the envelope, then downloads all pages in
+    parallel, projected by the server, and returns them as a single Esri JSON feature set.
+    The layer metadata is read once and used as the schema of the feature set. Cache
+    files are read and written on the executor so the event loop is not blocked.
+
+    Services without pagination support ignore resultOffset, those are downloaded in
+    batches of object IDs instead. Raises if a page comes back incomplete.
+    """
+    loop = asyncio.get_running_loop()
+    query_url = f"{feature_service_url}/query"
+    filter_params = {"where": "1=1",
+                     "geometry": envelope,
+                     "geometryType": "esriGeometryEnvelope",
+                     "inSR": wgs84_sr.factoryCode,
+                     "spatialRel": "esriSpatialRelIntersects"}
+
+    layer_info = await fetch_json(session, semaphore, feature_service_url, {"f": "json"})
+
+    # Services that have not been edited since the last run are read from the cache
+    cache_file = cache_path(feature_service_url, envelope, layer_info)
+    if cache_file and os.path.exists(cache_file):
+        print(f"Service unchanged since last download, using {cache_file}")
+        return await loop.run_in_executor(executor, read_cache, cache_file)
+
+    layer_page_size = min(page_size, layer_info.get("maxRecordCount") or page_size)
+    output_params = {"outFields": "*",
+                     "outSR": target_sr.factoryCode,
+                     "geometryPrecision": geometry_precision,
+                     "f": "json"}
+
+    # Older services have no advancedQueryCapabilities and do not support pagination either
+    supports_pagination = layer_info.get("advancedQueryCapabilities", {}).get("supportsPagination", False)
+    if supports_pagination:
+        count = await fetch_json(session, semaphore, query_url,
+                                 {**filter_params, "returnCountOnly": "true", "f": "json"})
+        feature_count = count["count"]
+        page_count = math.ceil(feature_count / layer_page_size)
+        page_params = [{**filter_params,
+                        **output_params,
+                        "orderByFields": layer_info.get("objectIdField", ""),
+                        "resultOffset": k * layer_page_size,
+                        "resultRecordCount": layer_page_size}
+                       for k in range(page_count)]
+    else:
+        # The ID query is not capped by maxRecordCount, the IDs already satisfy the filter
+        ids = await fetch_json(session, semaphore, query_url,
+                               {**filter_params, "returnIdsOnly": "true", "f": "json"})
+        object_ids = sorted(ids.get("objectIds") or [])
+        feature_count = len(object_ids)
+        page_count = math.ceil(feature_count / layer_page_size)
+        page_params = [{**output_params,
+                        "objectIds": ",".join(map(str, object_ids[k * layer_page_size:(k + 1) * layer_page_size]))}
+                       for k in range(page_count)]
+    print(f"Downloading {feature_count} features in {page_count} pages...")
+
+    pages = await asyncio.gather(*[fetch_json(session, semaphore, query_url, params,
+                                              post=not supports_pagination)
+                                   for params in page_params])
+
+    # A truncated page means features were dropped by the server, fail rather than save a partial layer
+    for k, page in enumerate(pages):
+        expected = min(layer_page_size, feature_count - k * layer_page_size)
+        received = len(page.get("features", []))
+        if page.get("exceededTransferLimit") or received < expected:
+            raise RuntimeError(f"{query_url}: page {k + 1} of {page_count} returned {received} "
+                               f"of {expected} features, the service changed or truncated the download")
+
+    feature_set = {"geometryType": layer_info.get("geometryType"),
+                   "spatialReference": {"wkid": target_sr.factoryCode},
+                   "fields": layer_info.get("fields", []),
+                   "features": [feature for page in pages for feature in page.get("features", [])]}
+
+    if cache_file:
+        await loop.run_in_executor(executor, write_cache, cache_file, feature_set)
+    return feature_set
+
+
+def save_feature_set(feature_set_json, output_fc, filtered_perimeter, CO_perim):
     """
-    Downloads a feature service URL, saves to output_fc, and clips data to Colorado.
+    Saves a downloaded feature set to output_fc and keeps the features that intersect
+    Colorado. Perimeters crossing the state line are kept whole, not cut.
+    """
+    # Geoprocessing writes into the same geodatabase are not thread-safe, run them one at a time
+    with write_lock:
+        try:
+            feature_set = arcpy.AsShape(feature_set_json, True)
+            temp_result = arcpy.CopyFeatures_management(feature_set, output_fc)
+            temp_fc = temp_result.getOutput(0)
+            print(f"Feature service data save to {temp_fc}")
+        except Exception as e:
+            print(f"Error saving feature service data: {e}")
+            return
+
+        # Select the features intersecting Colorado, the server only filtered on the Colorado envelope
+        print(f"Clipping {temp_fc} to Colorado extent...")
+        try:
+            arcpy.MakeFeatureLayer_management(temp_fc, "fires_fc_lyr")
+            arcpy.SelectLayerByLocation_management(
+                in_layer="fires_fc_lyr",
+                overlap_type="INTERSECT",
+                select_features=CO_perim
+            )
+            arcpy.CopyFeatures_management("fires_fc_lyr", filtered_perimeter)
+            arcpy.Delete_management("fires_fc_lyr")
+            print(f"Clipped data saved to {filtered_perimeter}")
+        except Exception as e:
+            print(f"Error during clip/selection: {e}")
+
+
+async def import_feature_service_filter(session, semaphore, executor, feature_service_url, output_fc,
+                                        filtered_perimeter, CO_perim, envelope):
+    """
+    Downloads the features of a feature service URL that intersect the envelope, already
+    projected to NAD 83 UTM Zone 13N, then saves and selects them on a worker thread so
+    the other downloads keep running.
     """
     # Download data
     try:
-        print("Loading feature service...")
-        feature_set = arcpy.FeatureSet()
-        feature_set.load(feature_service_url)
-        temp_result = arcpy.CopyFeatures_management(feature_set, output_fc)
-        temp_fc = temp_result.getOutput(0)
-        print(f"Feature service data save to {temp_fc}")
+        print(f"Loading feature service {feature_service_url}...")
+        feature_set_json = await fetch_features(session, semaphore, executor, feature_service_url, envelope)
     except Exception as e:
-        print(f"Error loading or saving feature service data: {e}")
+        print(f"Error loading feature service data: {e}")
         return
 
-    # Project data to NAD 1983 UTM Zone 13N
-    try:
-        print(f"Projecting to NAD 83 UTM Zone 13N ({target_sr.name})...")
-        projected_fc = arcpy.Project_management(temp_fc, "projected_fc.shp", target_sr)
-    except Exception as e:
-        print(f"Error projecting data: {e}")
-        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, save_feature_set,
+                               feature_set_json, output_fc, filtered_perimeter, CO_perim)
 
-    # Clip to Colorado extent
-    print("Clipping to Colorado extent...")
-    try:
-        arcpy.MakeFeatureLayer_management(projected_fc, "fires_fc_lyr")
-        arcpy.SelectLayerByLocation_management(
-            in_layer="fires_fc_lyr",
-            overlap_type="INTERSECT",
-            select_features=CO_perim
-        )
-        arcpy.CopyFeatures_management("fires_fc_lyr", filtered_perimeter)
-        print(f"Clipped data saved to {filtered_perimeter}")
-    except Exception as e:
-        print(f"Error during clip/selection: {e}")
 
-    # Cleanup
-    print("Cleaning up interim data...")
-    try:
-        if arcpy.Exists(temp_fc):
-            arcpy.Delete_management(temp_fc)
-        if arcpy.Exists(output_fc):
-            arcpy.Delete_management(output_fc)
-        if arcpy.Exists(projected_fc):
-            arcpy.Delete_management(projected_fc)
-    except Exception as e:
-        print(f"Cleanup error: {e}")
+async def download_all(downloads, envelope):
+    """
+    Downloads all feature services over one HTTP session, so connections are reused
+    across services, and saves each one as soon as it is downloaded. Requests of all
+    services share one limit of max_concurrent_requests.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    async with aiohttp.ClientSession() as session:
+        with ThreadPoolExecutor(max_workers=max_download_workers) as executor:
+            jobs = []
+            for i, (name, url, out_name) in enumerate(downloads):
+                print(f"!Downloading {name}")
+                jobs.append(import_feature_service_filter(session,
+                                                          semaphore,
+                                                          executor,
+                                                          url,
+                                                          f"memory/tmp_output_{i}",
+                                                          os.path.join(scratch_gdb, out_name),
+                                                          CO_perim,
+                                                          envelope))
+            await asyncio.gather(*jobs)
 
 
 # Download data
-scratch_out = os.path.join(scratch_gdb, "tmp_output")
-
-# 1 MTBS
-# Currently there is an issue with the map service that does not download all of the fires
-#print("!Downloading MTBS")
-#import_feature_service_filter(MTBS_url,
-                              #scratch_out,
-                              #os.path.join(scratch_gdb, "mtbs_dwnld"),
-                              #CO_perim)
-
-# 2 WFIGS Current
-print("!Downloading WFIGS Current")
-import_feature_service_filter(wfigs_interagency_url,
-                              scratch_out,
-                              os.path.join(scratch_gdb, "wfigs_current_dwnld"),
-                              CO_perim)
-
-# 3 WFIGS Historical
-print("!Downloading WFIGS Historical")
-# noinspection PyNoneFunctionAssignment
-import_feature_service_filter(wfigs_historical_url,
-                              scratch_out,
-                              os.path.join(scratch_gdb, "wfigs_historical_dwnld"),
-                              CO_perim)
-
-# 4 GeoMAC
-print("!Downloading GeoMAC")
-import_feature_service_filter(geomac_url,
-                              scratch_out,
-                              os.path.join(scratch_gdb, "geomac_dwnld"),
-                              CO_perim)
-
-# 5 BLM
-print("!Downloading BLM")
-import_feature_service_filter(blm_veg_url,
-                              scratch_out,
-                              os.path.join(scratch_gdb, "blm_dwnld"),
-                              CO_perim)
-
-# 6 USFS Fire Perimeters
-# ## Takes too long to run
-#print("!Downloading USFS")
-#import_feature_service_filter(usfs_url,
-#                              scratch_out,
-#                              os.path.join(scratch_gdb, "usfs_dwnld"),
-#                              CO_perim)
+co_envelope = envelope_wgs84(CO_perim)
+
+# Feature services to download: (name, service URL, output feature class)
+downloads = [
+    # 1 MTBS
+    # Currently there is an issue with the map service that does not download all of the fires
+    #("MTBS", MTBS_url, "mtbs_dwnld"),
+
+    # 2 WFIGS Current
+    ("WFIGS Current", wfigs_interagency_url, "wfigs_current_dwnld"),
+
+    # 3 WFIGS Historical
+    ("WFIGS Historical", wfigs_historical_url, "wfigs_historical_dwnld"),
+
+    # 4 GeoMAC
+    ("GeoMAC", geomac_url, "geomac_dwnld"),
+
+    # 5 BLM
+    ("BLM", blm_veg_url, "blm_dwnld"),
+
+    # 6 USFS Fire Perimeters
+    # ## Takes too long to run
+    #("USFS", usfs_url, "usfs_dwnld"),
+]
+
+# Downloads are independent and network-bound, run them side by side.
+# Each job gets its own interim feature class so the jobs do not overwrite each other,
+# interim data is kept in memory and goes away when the script ends.
+asyncio.run(download_all(downloads, co_envelope))
@@ -37,21 +37,22 @@ Example directory structure:
         │     └── perimeter_update.gdb   (scratch workspace, created by script)
 
 The script then:
-    - Copies and standardizes attributes across datasets
-    - Adds missing fields to match a final schema
-    - Applies mapping rules to harmonize naming, dates, and identifiers
-    - Filters perimeters to a given year range (default: 1984–2024)
+    - Reads each dataset once, filtered to a given year range (default: 1984–2024)
     - Selects prescribed fire treatments for BLM and USFS
-    - Merges all outputs into a single feature class:
+    - Applies mapping rules to harmonize naming, dates, and identifiers
+    - Inserts all outputs into a single feature class with the final schema:
         raw_Colorado_Fire_Perimeters_duplicates
-    - Repairs geometry and removes extraneous fields
+    - Checks geometry and repairs the features with problems
 
 Future enhancements will include automating the pre-processing steps so that
 downloaded datasets can be ingested directly.
 """
 
 import arcpy
+import multiprocessing
+import numpy as np
 import os
+import pandas as pd
 
 # --- Configurable Base Directories ---
 base_dir = r'C:\Users\semue\Documents\GITHUB\Fire_Perimeters_Severity'
@@ -62,8 +63,8 @@ scratch_gdb = os.path.join(data_dir, 'perimeter_update.gdb')
 arcpy.env.workspace = scratch_gdb
 arcpy.env.overwriteOutput = True
 
-# --- Temporary Outputs ---
-tmp_mapping = os.path.join(scratch_gdb, "tmp_mapping")
+# Define target spatial reference
+target_sr = arcpy.SpatialReference(26913)  # NAD 1983 UTM Zone 13N
 
 # --- Final Output for Combined Perimeters ---
 combined_perimeters = os.path.join(scratch_gdb, "raw_Colorado_Fire_Perimeters_duplicates")
@@ -71,56 +72,143 @@ combined_perimeters = os.path.join(scratch_gdb, "raw_Colorado_Fire_Perimeters_du
 dt_start = 2025  # START DATE for filter
 dt_end = 2026  # END DATE for filter
 
+# ListFields results per feature class, dropped whenever fields are added
+field_cache = {}
 
-def add_new_fields(fc, final_field_list):
-    """ Add final gdb fields to perimeter feature classes """
-    existing_fields = [f.name for f in arcpy.ListFields(fc)]
-    for field_name, field_type in final_field_list.items():
-        if field_name not in existing_fields:
-            arcpy.AddField_management(fc, field_name, field_type)
 
+def list_fields(fc):
+    """ Get the fields of the feature class, listing them only once per feature class """
+    if fc not in field_cache:
+        field_cache[fc] = arcpy.ListFields(fc)
+    return field_cache[fc]
 
-def apply_mapping(fc, mapping, final_field_list):
-    """ Update new fields in the feature class using the provided mapping """
-    all_fields = list(set(mapping.keys()).union(fc_fields(fc)))
 
-    with arcpy.da.UpdateCursor(fc, all_fields) as cursor:
-        for row in cursor:
-            row_dict = dict(zip(all_fields, row))
-            updated_row = list(row)
+def add_new_fields(fc, final_field_items):
+    """ Add final gdb fields to perimeter feature classes """
+    existing_fields = fc_fields(fc)
+    new_fields = [[field_name, field_type] for field_name, field_type in final_field_items
+                  if field_name not in existing_fields]
+    if new_fields:
+        arcpy.management.AddFields(fc, new_fields)
+        field_cache.pop(fc, None)
+
+
+def read_features(fc, source_fields, where_clause):
+    """ Read the geometry and source fields of the selected features into a DataFrame indexed by OID """
+    fields = [f for f in list_fields(fc) if f.name in source_fields]
+    columns = ["OID@", "SHAPE@WKB"] + [f.name for f in fields]
+    with arcpy.da.SearchCursor(fc, columns, where_clause, target_sr) as cursor:
+        df = pd.DataFrame.from_records(list(cursor), columns=columns, index="OID@")
+    for f in fields:
+        if f.type == "Date":
+            df[f.name] = pd.to_datetime(df[f.name])
+    return df
+
+
+def to_field_type(values, field_type):
+    """ Cast mapped values to match the type of the output field """
+    if field_type in ["LONG", "SHORT"]:
+        return pd.to_numeric(values, errors="coerce").astype("Int64")
+    if field_type in ["FLOAT", "DOUBLE"]:
+        return pd.to_numeric(values, errors="coerce")
+    return values
+
+
+def map_column(df, source_field, transform):
+    """ Evaluate one mapping entry: a named transform of a source column, or a constant without a source """
+    if source_field is None:
+        return transform
+    return column_transforms[transform](df[source_field])
+
+
+def mapping_source_fields(mapping):
+    """ Source fields read by a mapping """
+    return {source_field for source_field, _ in mapping.values() if source_field is not None}
+
+
+def apply_mapping(df, mapping, final_field_items, final_field_names):
+    """ Compute the final fields of the features using the provided mapping """
+    # Evaluate each mapping once over the whole table
+    mapped = pd.DataFrame(index=df.index)
+    for field_name, field_type in final_field_items:
+        if field_name in mapping:
+            try:
+                values = pd.Series(map_column(df, *mapping[field_name]), index=df.index)
+                mapped[field_name] = to_field_type(values, field_type)
+            except Exception as e:
+                print(f"Error processing field {field_name}: {e}")
+
+    # Fields without a mapping are left NULL
+    return mapped.reindex(columns=final_field_names)
+
+
+def year_clause(fc, year_field, start_year, end_year):
+    """ SQL clause selecting the source features within the year range """
+    field_type = next(f.type for f in list_fields(fc) if f.name == year_field)
+    if field_type == "Date":
+        # Compare the raw dates rather than extracting the year from every row
+        return (f"{year_field} >= date '{start_year}-01-01 00:00:00' AND "
+                f"{year_field} < date '{end_year + 1}-01-01 00:00:00'")
+    if field_type == "String":
+        return f"{year_field} >= '{start_year}' AND {year_field} <= '{end_year}'"
+    return f"{year_field} BETWEEN {start_year} AND {end_year}"
+
+
+def repair_flagged_geometry(fc):
+    """ Repair only the features Check Geometry reports problems for """
+    check_table = arcpy.management.CheckGeometry(fc, "memory/check_geometry")[0]
+    flagged = {row[0] for row in arcpy.da.SearchCursor(check_table, ["FEATURE_ID"])}
+    arcpy.management.Delete(check_table)
+    if not flagged:
+        print(f"No geometry problems found in {fc}")
+        return
+
+    oid_field = arcpy.Describe(fc).OIDFieldName
+    oids = ",".join(str(oid) for oid in sorted(flagged))
+    flagged_lyr = arcpy.management.MakeFeatureLayer(fc, "flagged_lyr", f"{oid_field} IN ({oids})")[0]
+    arcpy.management.RepairGeometry(flagged_lyr)
+    arcpy.management.Delete(flagged_lyr)
+    print(f"Repaired {len(flagged)} features in {fc}")
 
-            for field_name in final_field_list.keys():
-                map_func = mapping.get(field_name)
-                if map_func:
-                    try:
-                        value = map_func(row_dict)
-                        updated_row[all_fields.index(field_name)] = value
-                    except Exception as e:
-                        print(f"Error processing field {field_name}: {e}")
 
-            cursor.updateRow(updated_row)
+def fc_fields(fc):
+    """ Get the set of all field names in the feature class """
+    return frozenset(f.name for f in list_fields(fc))
 
 
-def filter_by_year(fc, start_year, end_year, final_output):
-    filter_years_clause = f"n_Year >= {start_year} AND n_Year <= {end_year}"
-    arcpy.MakeFeatureLayer_management(fc, "year_filter_lyr", filter_years_clause)
-    arcpy.CopyFeatures_management("year_filter_lyr", final_output)
+def non_empty(values):
+    """ Column values with empty strings replaced by NULL """
+    return values.where(values != "")
 
 
-def fc_fields(fc):
-    """ Get a list of all field names in the feature class """
-    return [f.name for f in arcpy.ListFields(fc)]
+def title_case(values):
+    """ Title case column values, with empty strings replaced by NULL """
+    return non_empty(values).str.title()
 
 
-def process_fire_layer(input_fc, output_fc, mapping, final_field_list, final_output, start_year, end_year):
-    """ Full process: add fields, apply mapping, and save to output"""
+def map_fire_layer(input_fc, mapping, year_field, final_field_items, final_field_names,
+                   start_year, end_year, where_clause=None):
+    """ Read features within the year range and apply mapping, returning the output rows (runs in a worker) """
+    arcpy.env.workspace = scratch_gdb
     print(f"Processing {input_fc}")
-    arcpy.CopyFeatures_management(input_fc, output_fc)
-    add_new_fields(output_fc, final_field_list)
-    apply_mapping(output_fc, mapping, final_field_list)
-    filter_by_year(output_fc, start_year, end_year, final_output)
-    arcpy.Delete_management(output_fc)
-    print(f"Saved output to {final_output}")
+    selection = year_clause(input_fc, year_field, start_year, end_year)
+    if where_clause:
+        selection = f"({where_clause}) AND ({selection})"
+    df = read_features(input_fc, mapping_source_fields(mapping), selection)
+    mapped = apply_mapping(df, mapping, final_field_items, final_field_names)
+
+    # Mapped rows with their geometry as WKB so they can be sent back to the parent, missing values as NULL
+    columns = [[None if pd.isna(v) else v for v in mapped[field_name].tolist()] for field_name in final_field_names]
+    columns.append(df["SHAPE@WKB"].tolist())
+    return input_fc, list(zip(*columns))
+
+
+def insert_features(final_output, final_field_names, input_fc, rows):
+    """ Insert the mapped rows of a layer into the output """
+    with arcpy.da.InsertCursor(final_output, final_field_names + ("SHAPE@WKB",)) as cursor:
+        for row in rows:
+            cursor.insertRow(row)
+    print(f"Inserted {len(rows)} features from {input_fc} into {final_output}")
 
 
 # Perimeter feature classes
@@ -147,172 +235,196 @@ final_fields = {"n_Fire_ID": "TEXT",
                 "n_Priority": "SHORT"
                 }
 
+# Final field names and (name, type) pairs, built once and passed to every layer
+final_field_names = tuple(final_fields.keys())
+final_field_items = tuple(final_fields.items())
+
 # Dataset mappings
+# Each entry is (source field, transform name) and is evaluated once over the whole source column.
+# Entries without a source field, (None, value), set the same value on every feature.
+# The *_year_field is the source field n_Year comes from, used to filter the year range on read.
+
+# Column transforms available to the mappings
+column_transforms = {
+    "value": lambda values: values,
+    "non_empty": non_empty,
+    "title": title_case,
+    "year": lambda values: values.dt.year,
+    "month": lambda values: values.dt.month,
+    "day": lambda values: values.dt.day,
+    "unnamed_as_unknown": lambda values: values.where(values != 'UNNAMED', 'Unknown'),
+    "rx_fire_type": lambda values: np.where(values == 'RX', 'Prescribed Fire', 'Wildfire'),
+    "wildfire_fire_type": lambda values: np.where(values.str.startswith('Wildfire', na=False),
+                                                  'Wildfire', 'Prescribed Fire'),
+    }
 
 # MTBS
+mtbs_year_field = "Ig_Date"
 mtbs_mapping = {
-    "n_Fire_ID": lambda row: row['Event_ID'],
-    "n_Fire_Name": lambda row: 'Unknown' if row['Incid_Name'] == 'UNNAMED' else row['Incid_Name'],
-    "n_Fire_Label": lambda row: row['Incid_Name'].title() if row['Incid_Name'] else None,
-    "n_Year": lambda row: row['Ig_Date'].year if row['Ig_Date'] else None,
-    "n_StartMonth": lambda row: row['Ig_Date'].month if row['Ig_Date'] else None,
-    "n_StartDay": lambda row: row['Ig_Date'].day if row['Ig_Date'] else None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: row['Incid_Type'],
-    "n_Agency": lambda row: None,
-    "n_Source": lambda row: 'MTBS',
-    "n_SourceID": lambda row: row['Event_ID'],
-    "n_Priority": lambda row: '1'
+    "n_Fire_ID": ('Event_ID', 'value'),
+    "n_Fire_Name": ('Incid_Name', 'unnamed_as_unknown'),
+    "n_Fire_Label": ('Incid_Name', 'title'),
+    "n_Year": ('Ig_Date', 'year'),
+    "n_StartMonth": ('Ig_Date', 'month'),
+    "n_StartDay": ('Ig_Date', 'day'),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": ('Incid_Type', 'value'),
+    "n_Agency": (None, None),
+    "n_Source": (None, 'MTBS'),
+    "n_SourceID": ('Event_ID', 'value'),
+    "n_Priority": (None, 1)
     }
 
 # WFIGS interagency
+wfigs_interagency_year_field = "attr_FireDiscoveryDateTime"
 wfigs_interagency_mapping = {
-    "n_Fire_ID": lambda row: None,
-    "n_Fire_Name": lambda row: row['poly_IncidentName'],
-    "n_Fire_Label": lambda row: row['poly_IncidentName'].title() if row['poly_IncidentName'] else None,
-    "n_Year": lambda row: row['attr_FireDiscoveryDateTime'].year if row['attr_FireDiscoveryDateTime'] else None,
-    "n_StartMonth": lambda row: row['attr_FireDiscoveryDateTime'].month if row['attr_FireDiscoveryDateTime'] else None,
-    "n_StartDay": lambda row: row['attr_FireDiscoveryDateTime'].day if row['attr_FireDiscoveryDateTime'] else None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: 'Prescribed Fire' if row['attr_IncidentTypeCategory'] == 'RX' else 'Wildfire',
-    "n_Agency": lambda row: row['attr_POOProtectingAgency'],
-    "n_Source": lambda row: 'WFIGS Interagency',
-    "n_SourceID": lambda row: row['attr_UniqueFireIdentifier'],
-    "n_Priority": lambda row: '2'
+    "n_Fire_ID": (None, None),
+    "n_Fire_Name": ('poly_IncidentName', 'value'),
+    "n_Fire_Label": ('poly_IncidentName', 'title'),
+    "n_Year": ('attr_FireDiscoveryDateTime', 'year'),
+    "n_StartMonth": ('attr_FireDiscoveryDateTime', 'month'),
+    "n_StartDay": ('attr_FireDiscoveryDateTime', 'day'),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": ('attr_IncidentTypeCategory', 'rx_fire_type'),
+    "n_Agency": ('attr_POOProtectingAgency', 'value'),
+    "n_Source": (None, 'WFIGS Interagency'),
+    "n_SourceID": ('attr_UniqueFireIdentifier', 'value'),
+    "n_Priority": (None, 2)
     }
 
 
 # WFIGS historical
+wfigs_historical_year_field = "FIRE_YEAR"
 wfigs_historical_mapping = {
-    "n_Fire_ID": lambda row: None,
-    "n_Fire_Name": lambda row: row['INCIDENT'],
-    "n_Fire_Label": lambda row: row['INCIDENT'].title() if row['INCIDENT'] else None,
-    "n_Year": lambda row: row['FIRE_YEAR'],
-    "n_StartMonth": lambda row: None,
-    "n_StartDay": lambda row: None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: 'Wildfire' if row['FEATURE_CA'] and row['FEATURE_CA'].startswith('Wildfire') else 'Prescribed Fire',
-    "n_Agency": lambda row: row['AGENCY'],
-    "n_Source": lambda row: 'WFIGS Historical',
-    "n_SourceID": lambda row: row['UNQE_FIRE_'] if row['UNQE_FIRE_'] else None,
-    "n_Priority": lambda row: '3'
+    "n_Fire_ID": (None, None),
+    "n_Fire_Name": ('INCIDENT', 'value'),
+    "n_Fire_Label": ('INCIDENT', 'title'),
+    "n_Year": ('FIRE_YEAR', 'value'),
+    "n_StartMonth": (None, None),
+    "n_StartDay": (None, None),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": ('FEATURE_CA', 'wildfire_fire_type'),
+    "n_Agency": ('AGENCY', 'value'),
+    "n_Source": (None, 'WFIGS Historical'),
+    "n_SourceID": ('UNQE_FIRE_', 'non_empty'),
+    "n_Priority": (None, 3)
     }
 
 # GeoMAC
+geomac_year_field = "fireyear"
 geomac_mapping = {
-    "n_Fire_ID": lambda row: None,
-    "n_Fire_Name": lambda row: row['incidentname'],
-    "n_Fire_Label": lambda row: row['incidentname'].title() if row['incidentname'] else None,
-    "n_Year": lambda row: row['fireyear'],
-    "n_StartMonth": lambda row: row['perimeterdatetime'].month if row['perimeterdatetime'] else None,
-    "n_StartDay": lambda row: row['perimeterdatetime'].day if row['perimeterdatetime'] else None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: 'Wildfire',
-    "n_Agency": lambda row: row['agency'],
-    "n_Source": lambda row: 'Geomac',
-    "n_SourceID": lambda row: row['uniquefireidentifier'] if row['uniquefireidentifier'] else None,
-    "n_Priority": lambda row: "4"
+    "n_Fire_ID": (None, None),
+    "n_Fire_Name": ('incidentname', 'value'),
+    "n_Fire_Label": ('incidentname', 'title'),
+    "n_Year": ('fireyear', 'value'),
+    "n_StartMonth": ('perimeterdatetime', 'month'),
+    "n_StartDay": ('perimeterdatetime', 'day'),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": (None, 'Wildfire'),
+    "n_Agency": ('agency', 'value'),
+    "n_Source": (None, 'Geomac'),
+    "n_SourceID": ('uniquefireidentifier', 'non_empty'),
+    "n_Priority": (None, 4)
     }
 
 # BLM Colorado
+blm_year_field = "TRTMNT_START_DT"
 blm_mapping = {
-    "n_Fire_ID": lambda row: None,
-    "n_Fire_Name": lambda row: row['TRTMNT_NM'],
-    "n_Fire_Label": lambda row: row['TRTMNT_NM'].title() if row['TRTMNT_NM'] else None,
-    "n_Year": lambda row: row['TRTMNT_START_DT'].year if row['TRTMNT_START_DT'] else None,
-    "n_StartMonth": lambda row: row['TRTMNT_START_DT'].month if row['TRTMNT_START_DT'] else None,
-    "n_StartDay": lambda row: row['TRTMNT_START_DT'].day if row['TRTMNT_START_DT'] else None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: 'Prescribed Fire',
-    "n_Agency": lambda row: 'BLM',
-    "n_Source": lambda row: 'BLM CO',
-    "n_SourceID": lambda row: row['UNIQUE_ID'] if row['UNIQUE_ID'] else None,
-    "n_Priority": lambda row: '5'
+    "n_Fire_ID": (None, None),
+    "n_Fire_Name": ('TRTMNT_NM', 'value'),
+    "n_Fire_Label": ('TRTMNT_NM', 'title'),
+    "n_Year": ('TRTMNT_START_DT', 'year'),
+    "n_StartMonth": ('TRTMNT_START_DT', 'month'),
+    "n_StartDay": ('TRTMNT_START_DT', 'day'),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": (None, 'Prescribed Fire'),
+    "n_Agency": (None, 'BLM'),
+    "n_Source": (None, 'BLM CO'),
+    "n_SourceID": ('UNIQUE_ID', 'non_empty'),
+    "n_Priority": (None, 5)
     }
 
 # USFS FACTS Common Attributtes
+usfs_year_field = "DATE_COMPLETED"
 usfs_mapping = {
-    "n_Fire_ID": lambda row: None,
-    "n_Fire_Name": lambda row: row['NAME'],
-    "n_Fire_Label": lambda row: row['NAME'].title() if row['NAME'] else None,
-    "n_Year": lambda row: row['DATE_COMPLETED'].year if row['DATE_COMPLETED'] else None,
-    "n_StartMonth": lambda row: row['DATE_COMPLETED'].month if row['DATE_COMPLETED'] else None,
-    "n_StartDay": lambda row: row['DATE_COMPLETED'].day if row['DATE_COMPLETED'] else None,
-    "n_GIS_Acres": lambda row: None,
-    "n_Fire_Type": lambda row: "Prescribed Fire",
-    "n_Agency": lambda row: 'USFS',
-    "n_Source": lambda row: 'USFS FACTS',
-    "n_SourceID": lambda row: row['EVENT_CN'],
-    "n_Priority": lambda row: "6"
+    "n_Fire_ID": (None, None),
+    "n_Fire_Name": ('NAME', 'value'),
+    "n_Fire_Label": ('NAME', 'title'),
+    "n_Year": ('DATE_COMPLETED', 'year'),
+    "n_StartMonth": ('DATE_COMPLETED', 'month'),
+    "n_StartDay": ('DATE_COMPLETED', 'day'),
+    "n_GIS_Acres": (None, None),
+    "n_Fire_Type": (None, "Prescribed Fire"),
+    "n_Agency": (None, 'USFS'),
+    "n_Source": (None, 'USFS FACTS'),
+    "n_SourceID": ('EVENT_CN', 'value'),
+    "n_Priority": (None, 6)
     }
 
 
-# Run field updates for each layer
-tmp_mapping = os.path.join(scratch_gdb, "tmp_mapping")
-
-# MTBS
-#process_fire_layer(MTBS, tmp_mapping, mtbs_mapping, final_fields,
-#                   os.path.join(scratch_gdb, 'mapping_mtbs'), dt_start, dt_end)
-
-# WFIGS interagency
-process_fire_layer(WFIGS_INTERAGENCY, tmp_mapping, wfigs_interagency_mapping, final_fields,
-                   os.path.join(scratch_gdb, 'mapping_wfigs_interagency'), dt_start, dt_end)
-
-# WFIGS historical
-#process_fire_layer(WFIGS_HISTORICAL, tmp_mapping, wfigs_historical_mapping, final_fields,
-#                   os.path.join(scratch_gdb, 'mapping_wfigs_historical'), dt_start, dt_end)
-
-# GeoMAC
-#process_fire_layer(GEOMAC, tmp_mapping, geomac_mapping, final_fields,
-#                   os.path.join(scratch_gdb, 'mapping_geomac'), dt_start, dt_end)
-'''
-# BLM Colorado
-# Select prescribed fire activities
-blm_where_clause = (
-    "TRTMNT_TYPE_CD = 3 AND "
-    "UPPER(TRTMNT_NM) NOT LIKE '%PILE%' AND "
-    "UPPER(TRTMNT_COMMENTS) NOT LIKE '%PILE%' AND "
-    "UPPER(TRTMNT_NM) NOT LIKE '%PILING%' AND "
-    "UPPER(TRTMNT_COMMENTS) NOT LIKE '%PILING%' AND "
-    "UPPER(TRTMNT_NM) NOT LIKE '%WILDFIRE%' AND "
-    "UPPER(TRTMNT_COMMENTS) NOT LIKE '%WILDFIRE%' AND "
-    "UPPER(TRTMNT_NM) NOT LIKE '%FIRE USE%' AND "
-    "UPPER(TRTMNT_COMMENTS) NOT LIKE '%FIRE USE%'"
-)
-arcpy.MakeFeatureLayer_management(BLM, "blm_lyr", blm_where_clause)
-process_fire_layer("blm_lyr", tmp_mapping, blm_mapping, final_fields,
-                   os.path.join(scratch_gdb, 'mapping_blm'), dt_start, dt_end)
-
-# USFS FACTS Common Attributes
-# Select prescribed fire activities
-FACTS_where_clause = (
-    "ACTIVITY = 'Broadcast Burning - Covers a majority of the unit' OR "
-    "ACTIVITY = 'Control of Understory Vegetation- Burning' OR "
-    "ACTIVITY = 'Site Preparation for Natural Regeneration - Burning' OR "
-    "ACTIVITY = 'Site Preparation for Planting - Burning' OR "
-    "ACTIVITY = 'Underburn - Low Intensity (Majority of Unit)' "
-)
-arcpy.MakeFeatureLayer_management(USFS, "usfs_lyr", FACTS_where_clause)
-process_fire_layer("usfs_lyr", tmp_mapping, usfs_mapping, final_fields,
-                   os.path.join(scratch_gdb, 'mapping_usfs'), dt_start, dt_end)
-'''
-# Combine all perimeters
-mapping_list = arcpy.ListFeatureClasses("mapping_*")
-perimeters_merge = arcpy.Merge_management(mapping_list,
-                                          os.path.join(scratch_gdb, "raw_Colorado_Fire_Perimeters_duplicates"))
-perimeters_merge_path = perimeters_merge.getOutput(0)
-
-# Repair geometry of final layer
-arcpy.RepairGeometry_management(perimeters_merge_path)
-
-# Delete extraneous fields
-print("Deleting unnecessary fields")
-perimeter_fields = set(final_fields.keys())
-merge_fields = [f.name for f in arcpy.ListFields(perimeters_merge_path)]
-for fld in merge_fields:
-    if fld not in perimeter_fields and fld.lower() not in ['objectid', 'shape', 'shape_length', 'shape_area']:
-        try:
-            arcpy.DeleteField_management(perimeters_merge_path, fld)
-        except:
-            print(f"{fld} not deleted")
-
+if __name__ == "__main__":
+    # Create the combined output with the final schema, each layer is inserted into it
+    arcpy.CreateFeatureclass_management(scratch_gdb, os.path.basename(combined_perimeters), "POLYGON",
+                                        spatial_reference=target_sr)
+    add_new_fields(combined_perimeters, final_field_items)
+
+    # Map each layer in its own worker process
+    jobs = []
+
+    # MTBS
+    #jobs.append((MTBS, mtbs_mapping,
+    #             mtbs_year_field, final_field_items, final_field_names,
+    #             dt_start, dt_end))
+
+    # WFIGS interagency
+    jobs.append((WFIGS_INTERAGENCY, wfigs_interagency_mapping,
+                 wfigs_interagency_year_field, final_field_items, final_field_names,
+                 dt_start, dt_end))
+
+    # WFIGS historical
+    #jobs.append((WFIGS_HISTORICAL, wfigs_historical_mapping,
+    #             wfigs_historical_year_field, final_field_items, final_field_names,
+    #             dt_start, dt_end))
+
+    # GeoMAC
+    #jobs.append((GEOMAC, geomac_mapping,
+    #             geomac_year_field, final_field_items, final_field_names,
+    #             dt_start, dt_end))
+    '''
+    # BLM Colorado
+    # Select prescribed fire activities
+    blm_where_clause = (
+        "TRTMNT_TYPE_CD = 3 AND "
+        "UPPER(TRTMNT_NM) NOT LIKE '%PILE%' AND "
+        "UPPER(TRTMNT_COMMENTS) NOT LIKE '%PILE%' AND "
+        "UPPER(TRTMNT_NM) NOT LIKE '%PILING%' AND "
+        "UPPER(TRTMNT_COMMENTS) NOT LIKE '%PILING%' AND "
+        "UPPER(TRTMNT_NM) NOT LIKE '%WILDFIRE%' AND "
+        "UPPER(TRTMNT_COMMENTS) NOT LIKE '%WILDFIRE%' AND "
+        "UPPER(TRTMNT_NM) NOT LIKE '%FIRE USE%' AND "
+        "UPPER(TRTMNT_COMMENTS) NOT LIKE '%FIRE USE%'"
+    )
+    jobs.append((BLM, blm_mapping,
+                 blm_year_field, final_field_items, final_field_names,
+                 dt_start, dt_end, blm_where_clause))
+
+    # USFS FACTS Common Attributes
+    # Select prescribed fire activities
+    FACTS_where_clause = (
+        "ACTIVITY = 'Broadcast Burning - Covers a majority of the unit' OR "
+        "ACTIVITY = 'Control of Understory Vegetation- Burning' OR "
+        "ACTIVITY = 'Site Preparation for Natural Regeneration - Burning' OR "
+        "ACTIVITY = 'Site Preparation for Planting - Burning' OR "
+        "ACTIVITY = 'Underburn - Low Intensity (Majority of Unit)' "
+    )
+    jobs.append((USFS, usfs_mapping,
+                 usfs_year_field, final_field_items, final_field_names,
+                 dt_start, dt_end, FACTS_where_clause))
+    '''
+    # Insert the mapped layers into the combined output
+    with multiprocessing.Pool(processes=len(jobs)) as pool:
+        for input_fc, rows in pool.starmap(map_fire_layer, jobs):
+            insert_features(combined_perimeters, final_field_names, input_fc, rows)
+
+    # Repair geometry of final layer, only where problems are found
+    repair_flagged_geometry(combined_perimeters)
@@ -29,7 +29,7 @@ Example directory structure:
 What the script does:
     1. Replaces inconsistent fire name strings (e.g., "Unknown", "Unnamed") with NULL
     2. Normalizes fire labels (removing suffixes, non-alphanumeric chars, etc.)
-    3. Builds proximity groups using a 500m near table (same year only)
+    3. Builds proximity groups from perimeters within 500m of each other (same year only)
     4. Groups by:
         - Proximity + Name similarity
         - Proximity + Start date
@@ -41,10 +41,17 @@ Future enhancements will include tuning similarity thresholds.
 """
 
 import arcpy
+import numpy as np
 import os
+import pandas as pd
 import re
-from collections import defaultdict
-from difflib import SequenceMatcher
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from rapidfuzz import fuzz, process
+from shapely.strtree import STRtree
+
+from _regex import label_suffix_re
 
 # Configuration
 base_dir = r'C:\Users\semue\Documents\GITHUB\Fire_Perimeters_Severity'
@@ -55,48 +62,52 @@ final_gdb = os.path.join(data_dir, 'final_perimeter_update.gdb')
 arcpy.env.workspace = scratch_gdb
 arcpy.env.overwriteOutput = True
 
+debug = False  # print per-perimeter diagnostics
+progress_step = 5000  # rows between progressor updates
+
 # File and Layer paths
 input_fc = os.path.join(scratch_gdb, 'raw_Colorado_Fire_Perimeters_duplicates')
 temp_copy = os.path.join(scratch_gdb, 'wrk_fires_start')
 provenance_table = os.path.join(final_gdb, "Fire_Perimeter_Provenance")
 final_output = os.path.join(scratch_gdb, 'duplication_check_output')
 
-# Create a copy of all fire perimeters as duplicates
-arcpy.CopyFeatures_management(input_fc, temp_copy)
-oid_field = [f.name for f in arcpy.ListFields(temp_copy) if f.type == "OID"][0]
+# Grouping and ID fields
+group_prox = "group_prox"
+group_name = "group_name"
+group_date = "group_date"
+true_duplicate_field = "True_Duplicate"
+norm_label = "Norm_Label"
+provenance_field = "Provenance_ID"
+near_distance = 500  # meters, perimeters closer than this are proximity matches
+label_threshold = 85  # minimum label similarity (0-100) for two perimeters to be name matches
 
-# Replace text "Unknown" or similar with Null to create consistency
-print("Replacing unnamed attributes with NULL")
-fields = [f.name for f in arcpy.ListFields(temp_copy) if f.type in ["String"]]
-with arcpy.da.UpdateCursor(temp_copy, fields) as cursor:
-    for row in cursor:
-        new_row = []
-        for value in row:
-            if isinstance(value, str) and value.strip().upper() in ["UNKNOWN", "UNNAMED", "UNK", "N/A"]:
-                new_row.append(None)
-            else:
-                new_row.append(value)
-        cursor.updateRow(new_row)
+# Text values treated as a missing name
+null_strings = {"UNKNOWN", "UNNAMED", "UNK", "N/A"}
 
 
 # --- CLEAN STRINGS ---
+def null_if_unknown(value):
+    if isinstance(value, str) and value.strip().upper() in null_strings:
+        return None
+    return value
+
+
+# Any non-alphanumeric character
+non_alnum_re = re.compile(r'[^A-Za-z0-9]')
+
+
+@lru_cache(maxsize=None)
 def normalize_label(label_str): 
     if not label_str:
         return ""
     label_new = label_str.strip()
-    # Strip trailing "wfu", "fire", or "wildfire"
-    label_new = re.sub(r'\s+(wfu|(wild)?fire)$', '', label_new, flags=re.IGNORECASE)
-    # Remove trailing prescribed fire unit numbers like "UNIT 2", "U2", "UNIT2"
-    label_new = re.sub(r'\s+U(NIT)?[\s\w\-\\/]*$', '', label_new, flags=re.IGNORECASE)
+    # Strip trailing "wfu", "fire", or "wildfire" and prescribed fire unit numbers like "UNIT 2", "U2", "UNIT2"
+    label_new = label_suffix_re.sub('', label_new)
     # Remove all non-alphanumeric characters
-    label_new = re.sub(r'[^A-Za-z0-9]', '', label_new)
+    label_new = non_alnum_re.sub('', label_new)
     return label_new.upper()
 
 
-def label_similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-
 # --- Union-find/ connected components ---
 def find_root(node, parent):
     while parent[node] != node:
@@ -105,171 +116,200 @@ def find_root(node, parent):
     return node
 
 
-def union(a, b, parent):
+def union(a, b, parent, size):
     ra, rb = find_root(a, parent), find_root(b, parent)
-    if ra != rb:
-        parent[rb] = ra
-
-
-# Prep Fields
-print("Adding grouping and ID fields")
-group_prox = "group_prox"
-group_name = "group_name"
-group_date = "group_date"
-true_duplicate_field = "True_Duplicate"
-norm_label = "Norm_Label"
-provenance_field = "Provenance_ID"
-
-for fld in [group_prox, group_name, group_date, true_duplicate_field, norm_label, provenance_field]:
-    if fld not in [f.name for f in arcpy.ListFields(temp_copy)]:
-        arcpy.AddField_management(temp_copy, fld, "LONG" if fld != norm_label else "TEXT")
-
-# Build proximity-based groups
-near_table = os.path.join("in_memory", "near_table")
-arcpy.GenerateNearTable_analysis(temp_copy, temp_copy, near_table, "500 Meters", "NO_LOCATION", "NO_ANGLE", "ALL", 0)
-print(f"Generated near table: {arcpy.GetCount_management(near_table)[0]} proximity pairs")
-
-# Map OID to year
-print("Building OID to Year mapping...")
-oid_to_year = {row[0]: row[1] for row in arcpy.da.SearchCursor(temp_copy, [oid_field, "n_Year"])}
-
-# Build adjacency list with year constraint
-adj = defaultdict(set)
-print("Filtering near pairs by year and building adjacency list")
-with arcpy.da.SearchCursor(near_table, ["IN_FID", "NEAR_FID"]) as cursor:
-    for in_fid, near_fid in cursor:
-        if in_fid == near_fid:
-            continue
-        # Only connect if they are from the same year
-        if oid_to_year.get(in_fid) == oid_to_year.get(near_fid):
-            adj[in_fid].add(near_fid)
-            adj[near_fid].add(in_fid)
-
-# Create parent dict
-all_oids = set(adj.keys())
-parent = {oid: oid for oid in all_oids}
-for a in all_oids:
-    for b in adj[a]:
-        union(a, b, parent)
-
-# Assign group IDs
-root_to_group = {}
-group_counter = 1
-oid_to_group = {}
-
-for oid in all_oids:
-    root = find_root(oid, parent)
-    if root not in root_to_group:
-        root_to_group[root] = group_counter
-        group_counter += 1
-    oid_to_group[oid] = root_to_group[root]
-
-# Update group ID field
-with arcpy.da.UpdateCursor(temp_copy, [oid_field, group_prox]) as cursor:
-    for row in cursor:
-        group_id = oid_to_group.get(row[0])
-        if group_id:
-            print(f"Assigning Prox_Group {group_id} to OID {row[0]}")
-            row[1] = group_id
-            cursor.updateRow(row)
-
-# Update norm_label
-with arcpy.da.UpdateCursor(temp_copy, ["n_Fire_Label", "Norm_Label"]) as cursor:
-    for row in cursor:
-        row[1] = normalize_label(row[0]) 
-        cursor.updateRow(row)
-
-# Group by proximity field and same normalized label
-print("Group perimeters by proximity and normalized label")
-name_match_groups = defaultdict(list)
-with arcpy.da.SearchCursor(temp_copy, [oid_field, group_prox, norm_label]) as cursor:
-    for oid, group, label in cursor:
-        print(f"OID: {oid}  group: {group}  label: {label}")
-        if group is not None and label:
-            name_match_groups[group].append((oid, label))
-
-group_id_counter = 1
-name_match_dict = {}
-
-for key, oid_label_list in name_match_groups.items():
-    clusters = []
-    for oid, label in oid_label_list:
-        placed = False
-        for cluster in clusters:
-            if label_similarity(label, cluster[0][1]) > 0.85:
-                cluster.append((oid, label))
-                placed = True
-                break
-        if not placed:
-            clusters.append([(oid, label)])
-
-    for cluster in clusters:
-        for oid, _ in cluster:
-            name_match_dict[oid] = group_id_counter
-        group_id_counter += 1
-
-with arcpy.da.UpdateCursor(temp_copy, [oid_field, group_name]) as cursor:
-    for row in cursor:
-        row[1] = name_match_dict.get(row[0])
-        cursor.updateRow(row)
-
-# Group by proximity field and same start month and start day
-print("Group perimeters by proximity and start date (month/year)")
-date_match_groups = defaultdict(list)
-with arcpy.da.SearchCursor(temp_copy, [oid_field, group_prox, "n_StartMonth", "n_StartDay"]) as cursor:
-    for oid, group, month, day in cursor:
-        print(f"OID: {oid}  group: {group}  month/day: {month}/{day}")
-        if group is None or month is None or day is None:
-            continue
-        date_match_groups[(group, month, day)].append(oid)
-
-oid_to_group_date = {}
-group_date_id_counter = 1
-
-for key, oid_list in date_match_groups.items():
-    for oid in oid_list:
-        oid_to_group_date[oid] = group_date_id_counter
-    group_date_id_counter += 1
-
-with arcpy.da.UpdateCursor(temp_copy, [oid_field, group_date]) as cursor:
-    for row in cursor:
-        row[1] = oid_to_group_date.get(row[0])
-        cursor.updateRow(row)
-
-# Group by proximity field and WHERE LABEL or DATE are the same
-print("Group perimeters by proximity and LABEL or START DATE (month/year)")
-duplicate_groups = defaultdict(list)
-with arcpy.da.SearchCursor(temp_copy, [oid_field, group_prox, group_name, group_date]) as cursor:
-    for oid, group, name, date in cursor:
-        print(f"OID: {oid}  group: {group}  label: {name}   month/day: {date}")
-        if group is None:
+    if ra == rb:
+        return
+    # Attach the smaller component under the larger one
+    if size[ra] < size[rb]:
+        ra, rb = rb, ra
+    parent[rb] = ra
+    size[ra] += size[rb]
+
+
+# --- Grouping, run on the grouping columns of the perimeters (indexed by OID) ---
+def compute_name_groups(groups_df):
+    # Cluster similar normalized labels within each proximity group
+    named = groups_df[groups_df[group_prox].notna() & (groups_df[norm_label] != "")]
+
+    group_id_counter = 1
+    name_match_dict = {}
+
+    for key, group_labels in named.groupby(group_prox, sort=False)[norm_label]:
+        # Equal labels always match, so only the distinct labels of the group are clustered
+        labels, label_index = np.unique(group_labels.to_numpy(dtype=str), return_inverse=True)
+        cluster_parent = list(range(len(labels)))
+        cluster_size = [1] * len(labels)
+        if len(labels) > 1:
+            # Similarity of every pair of labels in the group, labels that match are linked into clusters
+            sim = process.cdist(labels.tolist(), labels.tolist(), scorer=fuzz.ratio, score_cutoff=label_threshold,
+                                workers=-1)
+            for i, j in zip(*(idx.tolist() for idx in np.nonzero(sim > label_threshold))):
+                union(i, j, cluster_parent, cluster_size)
+
+        cluster_to_group = {}
+        for oid, i in zip(group_labels.index.tolist(), label_index.tolist()):
+            root = find_root(i, cluster_parent)
+            if root not in cluster_to_group:
+                cluster_to_group[root] = group_id_counter
+                group_id_counter += 1
+            name_match_dict[oid] = cluster_to_group[root]
+    return name_match_dict
+
+
+def compute_date_groups(groups_df):
+    # Group by proximity field and same start month and start day, numbered in the order they are first found
+    date_ids = groups_df.groupby([group_prox, "n_StartMonth", "n_StartDay"], sort=False).ngroup() + 1
+    # Perimeters missing any of the keys are not grouped (ngroup gives them -1 or NA)
+    date_ids = date_ids[date_ids > 0].astype(np.int64)
+    return dict(zip(date_ids.index.tolist(), date_ids.tolist()))
+
+
+def compute_true_duplicates(groups_df, name_match_dict, oid_to_group_date):
+    # Perimeters in the same proximity group sharing a name group or a date group are duplicates.
+    # Keys pack the proximity group and the name or date group id into one int, the top bit marks name groups
+    duplicate_groups = {}
+    for oid, group in groups_df[group_prox].items():
+        name, date = name_match_dict.get(oid), oid_to_group_date.get(oid)
+        if debug:
+            print(f"OID: {oid}  group: {group}  label: {name}   month/day: {date}")
+        if pd.isna(group):
             continue
+        group = int(group)
         if name is not None:
-            duplicate_groups[('name', group, name)].append(oid)
+            duplicate_groups.setdefault((1 << 63) | (group << 32) | name, []).append(oid)
         if date is not None:
-            duplicate_groups[('date', group, date)].append(oid)
-
-oid_to_dupl = {}
-dupl_id_counter = 1
-
-for key, oid_list in duplicate_groups.items():
-    for oid in oid_list:
-        if oid not in oid_to_dupl:
-            oid_to_dupl[oid] = dupl_id_counter
-    dupl_id_counter += 1
-
-with arcpy.da.UpdateCursor(temp_copy, [oid_field, true_duplicate_field]) as cursor:
-    for row in cursor:
-        dupl_val = oid_to_dupl.get(row[0])
+            duplicate_groups.setdefault((group << 32) | date, []).append(oid)
+
+    oid_to_dupl = {}
+    dupl_id_counter = 1
+
+    for key, oid_list in duplicate_groups.items():
+        for oid in oid_list:
+            if oid not in oid_to_dupl:
+                oid_to_dupl[oid] = dupl_id_counter
+        dupl_id_counter += 1
+    return oid_to_dupl
+
+
+if __name__ == "__main__":
+    # Create a copy of all fire perimeters as duplicates
+    arcpy.CopyFeatures_management(input_fc, temp_copy)
+    oid_field = [f.name for f in arcpy.ListFields(temp_copy) if f.type == "OID"][0]
+
+    # Prep Fields
+    print("Adding grouping and ID fields")
+
+    existing_fields = {f.name for f in arcpy.ListFields(temp_copy)}
+    for fld in [group_prox, group_name, group_date, true_duplicate_field, norm_label, provenance_field]:
+        if fld not in existing_fields:
+            arcpy.AddField_management(temp_copy, fld, "LONG" if fld != norm_label else "TEXT")
+
+    # Read every field the script uses or cleans in one pass, all grouping is done on these rows
+    all_fields = [oid_field, "n_Fire_Label", "n_Year", "n_StartMonth", "n_StartDay", group_prox, group_name,
+                  group_date, true_duplicate_field, norm_label, provenance_field]
+    string_fields = [f.name for f in arcpy.ListFields(temp_copy) if f.type in ["String"] and f.name not in all_fields]
+    all_fields += string_fields
+    field_index = {fld: i for i, fld in enumerate(all_fields)}
+    string_index = [field_index[f.name] for f in arcpy.ListFields(temp_copy)
+                    if f.type in ["String"] and f.name != norm_label]
+
+    # Replace text "Unknown" or similar with Null to create consistency
+    print("Reading perimeters and replacing unnamed attributes with NULL")
+    rows = {}
+    with arcpy.da.SearchCursor(temp_copy, all_fields) as cursor:
+        for row in cursor:
+            new_row = list(row)
+            for i in string_index:
+                new_row[i] = null_if_unknown(new_row[i])
+            rows[row[0]] = new_row
+
+    # Map OIDs to a dense 0..N-1 index, the union-find runs on lists over this index
+    print("Building OID to Year mapping...")
+    oids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+    # Missing years keep the sentinel so they still only match each other
+    year_index = field_index["n_Year"]
+    years = np.array([-1 if row[year_index] is None else row[year_index] for row in rows.values()],
+                     dtype=np.int64)
+
+    # Build proximity pairs with an STRtree over the perimeters, in the same dense index order
+    print(f"Finding perimeters within {near_distance}m of each other")
+    wkb_by_oid = {oid: wkb for oid, wkb in arcpy.da.SearchCursor(temp_copy, [oid_field, "SHAPE@WKB"])}
+    geoms = shapely.from_wkb([None if wkb_by_oid[oid] is None else bytes(wkb_by_oid[oid]) for oid in rows])
+    tree = STRtree(geoms)
+    # One bulk query for all perimeters, returns the (input, near) index pairs as two arrays
+    in_idx, near_idx = tree.query(geoms, predicate="dwithin", distance=near_distance).astype(np.int32)
+    print(f"Found {len(in_idx)} proximity pairs")
+
+    # Keep the pairs between different perimeters of the same year
+    print("Filtering near pairs by year")
+    keep = (in_idx != near_idx) & (years[in_idx] == years[near_idx])
+    in_idx, near_idx = in_idx[keep], near_idx[keep]
+
+    # Create parent list, plain lists are faster than NumPy arrays for the element-wise union loop
+    parent = list(range(len(oids)))
+    size = [1] * len(oids)
+    for a, b in zip(in_idx.tolist(), near_idx.tolist()):
+        union(a, b, parent, size)
+
+    # Assign group IDs, only perimeters with at least one near pair are grouped
+    linked = np.zeros(len(oids), dtype=bool)
+    linked[in_idx] = True
+    linked[near_idx] = True
+
+    root_to_group = {}
+    group_counter = 1
+    oid_to_group = {}
+
+    for i in np.flatnonzero(linked).tolist():
+        root = find_root(i, parent)
+        if root not in root_to_group:
+            root_to_group[root] = group_counter
+            group_counter += 1
+        oid_to_group[int(oids[i])] = root_to_group[root]
+    print(f"Assigned {len(oid_to_group)} perimeters to {group_counter - 1} proximity groups")
+
+    # Group ID and normalized label of each perimeter
+    for oid, row in rows.items():
+        group_id = oid_to_group.get(oid)
+        if group_id:
+            row[field_index[group_prox]] = group_id
+        row[field_index[norm_label]] = normalize_label(row[field_index["n_Fire_Label"]])
+
+    # Grouping columns of every perimeter, indexed by OID, missing values are NA
+    groups_df = pd.DataFrame.from_dict(
+        {oid: (row[field_index[group_prox]], row[field_index[norm_label]], row[field_index["n_StartMonth"]],
+               row[field_index["n_StartDay"]])
+         for oid, row in rows.items()},
+        orient="index", columns=[group_prox, norm_label, "n_StartMonth", "n_StartDay"])
+
+    # Name and date groups do not depend on each other, compute them side by side
+    print("Group perimeters by proximity and normalized label, and by proximity and start date (month/year)")
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        name_future = executor.submit(compute_name_groups, groups_df)
+        date_future = executor.submit(compute_date_groups, groups_df)
+        name_match_dict = name_future.result()
+        oid_to_group_date = date_future.result()
+    print(f"Found {len(set(name_match_dict.values()))} proximity/name groups")
+    print(f"Found {len(set(oid_to_group_date.values()))} proximity/start date groups")
+
+    # Group by proximity field and WHERE LABEL or DATE are the same
+    print("Group perimeters by proximity and LABEL or START DATE (month/year)")
+    oid_to_dupl = compute_true_duplicates(groups_df, name_match_dict, oid_to_group_date)
+
+    for oid, row in rows.items():
+        row[field_index[group_name]] = name_match_dict.get(oid)
+        row[field_index[group_date]] = oid_to_group_date.get(oid)
+        dupl_val = oid_to_dupl.get(oid)
         if dupl_val:
-            row[1] = dupl_val
-            cursor.updateRow(row)
-
-# Assign Provenance_ID based on final True Duplicate field or oid counter when not grouped
-dup_id_map = {}
-counter = 1
-with arcpy.da.UpdateCursor(temp_copy, [true_duplicate_field, "n_Year", "Provenance_ID"]) as cursor:
-    for true_dup, year, prov_id in cursor:
+            row[field_index[true_duplicate_field]] = dupl_val
+
+    # Assign Provenance_ID based on final True Duplicate field or oid counter when not grouped
+    dup_id_map = {}
+    counter = 1
+    for row in rows.values():
+        true_dup, year, prov_id = (row[field_index[true_duplicate_field]], row[field_index["n_Year"]],
+                                   row[field_index[provenance_field]])
         if prov_id:
             continue
         if true_dup is not None:
@@ -281,25 +321,45 @@ with arcpy.da.UpdateCursor(temp_copy, [true_duplicate_field, "n_Year", "Provenan
             new_prov = f"{year}{counter:03d}"
             counter += 1
 
-        cursor.updateRow((true_dup, year, new_prov))
-
-# Create provenance table to track all contributing source IDs
-print("Creating provenance table")
-arcpy.CreateTable_management(scratch_gdb, os.path.basename(provenance_table))
-arcpy.AddField_management(provenance_table, "Provenance_ID", "LONG")
-arcpy.AddField_management(provenance_table, "Original_ID", "TEXT", 100)
-arcpy.AddField_management(provenance_table, "Source", "TEXT", 50)
-arcpy.AddField_management(provenance_table, "Norm_Label", "TEXT", 100)
-arcpy.AddField_management(provenance_table, "Fire_Year", "SHORT")
-
-with arcpy.da.SearchCursor(temp_copy, ["Provenance_ID", "n_SourceID", "n_Source", "n_Fire_Label", "n_Year"]) as search_cursor, \
-        arcpy.da.InsertCursor(provenance_table, ["Provenance_ID", "Original_ID", "Source", "Norm_Label", "Fire_Year"]) as insert_cursor:
-    for pid, sid, source, label, year in search_cursor:
-        update_label = normalize_label(label)
-        insert_cursor.insertRow((pid, sid, source, update_label, year))
-
-# Export copy with true duplicates assigned
-arcpy.CopyFeatures_management(temp_copy, final_output)
-
-# Clean up
-arcpy.Delete_management(temp_copy)
+        row[field_index[provenance_field]] = new_prov
+
+    # Write all computed fields in one pass and one edit operation, only for rows that changed
+    print("Writing grouping and ID fields")
+    arcpy.SetProgressor("step", "Writing grouping and ID fields", 0, len(rows), progress_step)
+    updated = 0
+    with arcpy.da.Editor(scratch_gdb), arcpy.da.UpdateCursor(temp_copy, all_fields) as cursor:
+        for n, row in enumerate(cursor, start=1):
+            new_row = rows[row[0]]
+            if debug:
+                group_id = oid_to_group.get(row[0])
+                if group_id:
+                    print(f"Assigning Prox_Group {group_id} to OID {row[0]}")
+            if new_row != list(row):
+                cursor.updateRow(new_row)
+                updated += 1
+            if n % progress_step == 0:
+                arcpy.SetProgressorPosition(n)
+    arcpy.ResetProgressor()
+    print(f"Updated {updated} of {len(rows)} perimeters")
+
+    # Create provenance table to track all contributing source IDs
+    print("Creating provenance table")
+    arcpy.CreateTable_management(scratch_gdb, os.path.basename(provenance_table))
+    arcpy.AddField_management(provenance_table, "Provenance_ID", "LONG")
+    arcpy.AddField_management(provenance_table, "Original_ID", "TEXT", 100)
+    arcpy.AddField_management(provenance_table, "Source", "TEXT", 50)
+    arcpy.AddField_management(provenance_table, "Norm_Label", "TEXT", 100)
+    arcpy.AddField_management(provenance_table, "Fire_Year", "SHORT")
+
+    # Norm_Label was already written to the perimeters, insert all rows in one edit operation
+    with arcpy.da.Editor(os.path.dirname(provenance_table)), \
+            arcpy.da.SearchCursor(temp_copy, ["Provenance_ID", "n_SourceID", "n_Source", norm_label, "n_Year"]) as search_cursor, \
+            arcpy.da.InsertCursor(provenance_table, ["Provenance_ID", "Original_ID", "Source", "Norm_Label", "Fire_Year"]) as insert_cursor:
+        for row in search_cursor:
+            insert_cursor.insertRow(row)
+
+    # Export copy with true duplicates assigned
+    arcpy.CopyFeatures_management(temp_copy, final_output)
+
+    # Clean up
+    arcpy.Delete_management(temp_copy)
@@ -28,8 +28,8 @@ Outputs:
 
 import arcpy
 import os
-import re
-from collections import defaultdict
+
+from _regex import unit_suffix_re
 
 arcpy.env.overwriteOutput = True
 
@@ -43,11 +43,10 @@ dupl_perimeters = os.path.join(scratch_gdb, 'duplication_check_output')
 final_gdb = os.path.join(data_dir, 'final_perimeter_update.gdb')
 final_perimeters = os.path.join(final_gdb, 'fire_perimeters_update')
 
+sq_meters_to_acres = 0.000247105381  # acres in one square meter
+
 # Select best row data
 print("Selecting best row of data based on priority among duplicates")
-arcpy.MakeFeatureLayer_management(dupl_perimeters, "true_dupl_lyr")
-grouped_rows = defaultdict(list)
-
 fields_perimeters = ["n_Fire_ID",
                      "n_Fire_Name",
                      "n_Fire_Label",
@@ -63,45 +62,44 @@ fields_perimeters = ["n_Fire_ID",
 
 all_fields = ["True_Duplicate", "n_Priority"] + fields_perimeters
 
-with arcpy.da.SearchCursor("true_dupl_lyr", all_fields) as cursor:
+# Keep, per duplicate group, the best priority and the (priority, value) of the first non-null value
+# of each field by priority, updated as rows are read. Ties keep the earlier row.
+best = {}
+group_priority = {}
+with arcpy.da.SearchCursor(dupl_perimeters, all_fields) as cursor:
     for row in cursor:
         flag_val = row[0]
         priority = row[1]
-        field_values = dict(zip(fields_perimeters, row[2:]))
-
-        if flag_val is not None:
-            grouped_rows[flag_val].append({
-                "priority": priority,
-                **field_values
-            })
-            print(f"Duplicate Value: {flag_val} - {row}")
-        else:
+
+        if flag_val is None:
             print(f"⚠️ Skipping record with NULL True_Duplicate flag (OID unknown): {row}")
+            continue
+        print(f"Duplicate Value: {flag_val} - {row}")
 
-# Choose the best non_null source per intersect_group_field
-best_rows = []
+        rank = priority if priority is not None else float('inf')
+        if flag_val not in group_priority or rank < group_priority[flag_val][0]:
+            group_priority[flag_val] = (rank, priority)
 
-for intersect_group_field, rows in grouped_rows.items():
-    # Sort rows by priority
-    sorted_rows = sorted(rows, key=lambda x: x["priority"] if x["priority"] is not None else float('inf'))
+        cur = best.setdefault(flag_val, {})
+        for field, n_value in zip(fields_perimeters, row[2:]):
+            prev = cur.get(field)
+            if n_value not in [None, ""] and (prev is None or rank < prev[0]):
+                cur[field] = (rank, n_value)
 
-    # Dict to hold best value for each field
-    chosen_values = {field: None for field in fields_perimeters}
+# Choose the best non_null source per intersect_group_field
+best_rows = []
 
-    # Get the first non-null value for each field by priority
-    for field in fields_perimeters:
-        for row in sorted_rows:
-            n_value = row.get(field)
-            if n_value not in [None, ""]:
-                chosen_values[field] = n_value
-                break
+for intersect_group_field, chosen in best.items():
+    # Best value for each field, None when no row has one
+    chosen_values = {field: chosen[field][1] if field in chosen else None for field in fields_perimeters}
 
     # Print result
-    print(f"Flag Field {intersect_group_field}: {sorted_rows}")
+    print(f"Flag Field {intersect_group_field}:")
     for field in fields_perimeters:
         print(f"  {field} = {chosen_values[field]}")
 
-    merge_dict = {'True_Duplicate': intersect_group_field} | {'n_Priority': sorted_rows[0]['priority']} | chosen_values
+    merge_dict = ({'True_Duplicate': intersect_group_field} | {'n_Priority': group_priority[intersect_group_field][1]}
+                  | chosen_values)
     best_rows.append(merge_dict)
 
 # Build a lookup dictionary for fast access by intersect_group_field
@@ -110,8 +108,13 @@ update_lookup = {row["True_Duplicate"]: row for row in best_rows}
 # Add "True_Duplicate" and "n_Priority" to fields to update list
 fields_to_update = ["True_Duplicate", "n_Priority"] + fields_perimeters
 
+# Resolve the type conversion of each updated field once, outside the row loop
+int_fields = {"n_Year", "n_StartMonth", "n_StartDay", "n_Priority"}
+field_converters = [(i, field, int if field in int_fields else float if field == "n_GIS_Acres" else None)
+                    for i, field in enumerate(fields_to_update[1:], start=1)]
+
 # Use UpdateCursor to update the fields
-with arcpy.da.UpdateCursor("true_dupl_lyr", fields_to_update) as cursor:
+with arcpy.da.UpdateCursor(dupl_perimeters, fields_to_update) as cursor:
     for row in cursor:
         print(f"Updating row True Duplicate: {row[0]}, {row[4]}, {row[5]}")
         intersect_group_field = row[0]
@@ -121,18 +124,13 @@ with arcpy.da.UpdateCursor("true_dupl_lyr", fields_to_update) as cursor:
         update_row = update_lookup[intersect_group_field]
 
         try:
-            for i, field in enumerate(fields_to_update[1:], start=1):
+            for i, field, convert in field_converters:
                 val = update_row.get(field)
 
-                if val in ["", ""]:
-                    val = None
-
-                if val is None:
+                if val is None or val == "":
                     row[i] = None
-                elif field in ["n_Year", "n_StartMonth", "n_StartDay", "n_Priority"]:
-                    row[i] = int(val)
-                elif field == "n_GIS_Acres":
-                    row[i] = float(val)
+                elif convert:
+                    row[i] = convert(val)
                 else:
                     row[i] = val
 
@@ -141,7 +139,7 @@ with arcpy.da.UpdateCursor("true_dupl_lyr", fields_to_update) as cursor:
         except Exception as e:
             print(f"⚠️ Error updating row with True_Duplicate = {intersect_group_field}: {e}")
 
-out_dissolve = arcpy.Dissolve_management("true_dupl_lyr", os.path.join(scratch_gdb, "out_dissolve"),
+out_dissolve = arcpy.Dissolve_management(dupl_perimeters, os.path.join(scratch_gdb, "out_dissolve"),
                                          all_fields + ["Provenance_ID"])
 
 # Create FIRE ID
@@ -151,19 +149,34 @@ print(f"OID field name is: {oid_field}")
 
 # Add counter as placeholder for Null month/day values
 no_date_counter = 0
-with arcpy.da.UpdateCursor(out_dissolve, [oid_field, "SHAPE@", "n_Year", "n_StartMonth", "n_StartDay", "n_Fire_ID"]) as cursor:
+# Calculate GIS acres, clean up names and fire types in the same pass, all in one edit operation
+with arcpy.da.Editor(scratch_gdb), \
+        arcpy.da.UpdateCursor(out_dissolve, ["SHAPE@XY", "SHAPE@AREA", "n_Year", "n_StartMonth", "n_StartDay",
+                                             "n_Fire_ID", "n_GIS_Acres", "n_Fire_Name", "n_Fire_Label",
+                                             "n_Fire_Type"]) as cursor:
     for row in cursor:
-        oid, shape, year, month_val, day_val, fire_id = row
+        (x, y), area, year, month_val, day_val, fire_id, acres, fire_name, fire_label, fire_type = row
+        # Area is in square meters (NAD 1983 UTM Zone 13N)
+        row[6] = area * sq_meters_to_acres if area is not None else None
+
+        # Rename Fire NAME and LABEL
+        row[7] = unit_suffix_re.sub('', fire_name) if fire_name else fire_name
+        row[8] = unit_suffix_re.sub('', fire_label) if fire_label else fire_label
+
+        # Change wildland fire use type to wildfire
+        if fire_type == "Wildland Fire Use":
+            row[9] = "Wildfire"
 
         # If fire_id from MTBS already exists, skip update
         if fire_id is not None:
             print(f"ID STRING: {fire_id}  Length: {len(str(fire_id))} already exists!")
-            continue    # Skip update
+            cursor.updateRow(row)
+            continue    # Skip ID update
 
         # Create ID based on MTBS construction (CO + lat + long + YYYYMMDD) - 21 digits
-        centroid = shape.centroid
-        lat = str(centroid.Y).replace(".", "")
-        lon = str(abs(centroid.X)).replace(".", "")
+        # Fixed-width coordinates so every ID has the same length
+        lat = f"{y:09.5f}".replace(".", "")
+        lon = f"{abs(x):09.5f}".replace(".", "")
 
         # Format month
         if month_val is None:
@@ -186,48 +199,34 @@ with arcpy.da.UpdateCursor(out_dissolve, [oid_field, "SHAPE@", "n_Year", "n_Star
         row[5] = date_str
         cursor.updateRow(row)
 
-# Calculate GIS acres
-arcpy.CalculateField_management(out_dissolve, "n_GIS_Acres", "!shape.area@acres!", "PYTHON3")
-
-# Rename Fire NAME and LABEL
-with arcpy.da.UpdateCursor(out_dissolve, ["n_Fire_Name", "n_Fire_Label"]) as cursor:
-    for row in cursor:
-        row[0] = re.sub(r'\s+U(NIT)?[\s\w\-\\/]*$', '', row[0], flags=re.IGNORECASE) if row[0] else row[0]
-        row[1] = re.sub(r'\s+U(NIT)?[\s\w\-\\/]*$', '', row[1], flags=re.IGNORECASE) if row[1] else row[1]
-        cursor.updateRow(row)
-
-# Change wildland fire use type to wildfire
-with arcpy.da.UpdateCursor(out_dissolve, ["n_Fire_Type"]) as cursor:
-    for row in cursor:
-        if row[0] == "Wildland Fire Use":
-            row[0] = "Wildfire"
-
-        cursor.updateRow(row)
-
 # Rename/update final fields
 keep_fields = ['objectid', 'shape', 'shape_length', 'shape_area', "provenance_id"]  # all lowercase
-fields = [f.name for f in arcpy.ListFields(out_dissolve)]
-print(fields)
-
-arcpy.DeleteField_management(out_dissolve, 'n_Priority')
-
-for old_field in fields:
-    old_field_lower = old_field.lower()
-    if old_field.startswith("n_"):
-        new_field = old_field[2:]
-        try:
-            arcpy.AlterField_management(out_dissolve, old_field, new_field, new_field)
-            print(f"Renamed {old_field} to {new_field}")
-        except Exception as e:
-            print(f"Failed to rename {old_field}: {e}")
-    elif old_field_lower not in keep_fields and not any(old_field == f[2:] for f in fields if f.startswith("n_")):
-        try:
-            arcpy.DeleteField_management(out_dissolve, old_field)
-            print(f"Deleted {old_field}")
-        except:
-            print(f"{old_field} not deleted")
-
-arcpy.CopyFeatures_management(out_dissolve, final_perimeters)
+fields = arcpy.ListFields(out_dissolve)
+print([f.name for f in fields])
+
+# Final schema as one field mapping: n_ fields lose the prefix, n_Priority and every other field that is not
+# kept are dropped. The OID, shape and shape length/area fields are always written by the export.
+field_mappings = arcpy.FieldMappings()
+for field in fields:
+    if field.type in ["OID", "Geometry"] or field.name.lower() in ["shape_length", "shape_area"]:
+        continue
+    if field.name.startswith("n_") and field.name != "n_Priority":
+        new_field = field.name[2:]
+    elif field.name.lower() in keep_fields:
+        new_field = field.name
+    else:
+        continue
+
+    field_map = arcpy.FieldMap()
+    field_map.addInputField(out_dissolve[0], field.name)
+    output_field = field_map.outputField
+    output_field.name = new_field
+    output_field.aliasName = new_field
+    field_map.outputField = output_field
+    field_mappings.addFieldMap(field_map)
+    print(f"Writing {field.name} as {new_field}")
+
+arcpy.conversion.ExportFeatures(out_dissolve, final_perimeters, field_mapping=field_mappings)
 
 # Clean up
 print("Cleaning up files")
@@ -0,0 +1,11 @@
+"""
+Fire name clean-up patterns shared by '2_tag_duplicates.py' and '3_finalize_perimeters.py'
+"""
+
+import re
+
+# Trailing prescribed fire unit numbers like "UNIT 2", "U2", "UNIT2"
+unit_suffix_re = re.compile(r'\s+U(NIT)?[\s\w\-\\/]*$', flags=re.IGNORECASE)
+
+# Both suffixes in one pass, same result as removing the fire suffix and then the unit suffix
+label_suffix_re = re.compile(r'\s+(U(NIT)?[\s\w\-\\/]*|wfu|(wild)?fire)$', flags=re.IGNORECASE)